@@ -1,17 +1,23 @@
 # container_control_core.py  (v1.1 ‑ adds /api/update)
 from __future__ import annotations
 
-import importlib, logging, os, signal, sys, threading, time
-from datetime import UTC, datetime
+import asyncio, importlib, io, logging, os, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from types import ModuleType
-from typing import Any, Dict, Optional
+from typing import Any, Dict, NamedTuple, Optional
 
-import psutil, uvicorn
+import uvicorn, yaml
+from psutil import net_io_counters as _net_io_counters
+from app_adapter import ApplicationAdapter
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, Response
-from pydantic import BaseModel
-from ruamel.yaml import YAML
+from fastapi.responses import ORJSONResponse, Response
+
+try:  # libyaml-backed loader (needs libyaml-dev at image build)
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # pragma: no cover - pure-Python fallback
+    from yaml import SafeLoader as _YamlLoader
 
 # ---------- Logging (UTC) -------------------------------------------------- #
 logging.Formatter.converter = time.gmtime          # type: ignore[attr-defined]
@@ -23,44 +29,178 @@ logging.basicConfig(
 log = logging.getLogger("container_control_core")
 
 # ---------- Load YAML configuration --------------------------------------- #
-CFG = YAML(typ="safe").load(Path(os.getenv("CCC_CONFIG_FILE", "config.yaml")).read_text())
+_YAML_NULLS = (b"", b"~", b"null", b"Null", b"NULL")
+
+def _ryml_to_py(tree, node: int) -> Any:
+    """Walk a parsed ryml tree into plain dict / list / str structures.
+
+    Null scalars must become None, not "null" — config.yaml.example relies on
+    `run_as_user: null` and PyYAML's safe loader returns None for it.
+    """
+    if tree.is_map(node):
+        return {str(tree.key(tree.child(node, i)), "utf-8"): _ryml_to_py(tree, tree.child(node, i))
+                for i in range(tree.num_children(node))}
+    if tree.is_seq(node):
+        return [_ryml_to_py(tree, tree.child(node, i)) for i in range(tree.num_children(node))]
+    if not tree.has_val(node):
+        return None
+    val = bytes(tree.val(node))
+    return None if val in _YAML_NULLS else str(val, "utf-8")
+
+def _load_config(path: Path) -> Dict[str, Any]:
+    raw = path.read_bytes()
+    if os.getenv("CCC_YAML_BACKEND") == "ryml":
+        try:
+            import ryml  # zero-copy, parses in place — far faster on large configs
+        except ImportError:
+            log.warning("CCC_YAML_BACKEND=ryml but ryml is not installed; falling back to PyYAML")
+        else:
+            buf = bytearray(raw)                   # ryml mutates the buffer
+            tree = ryml.parse_in_place(buf)
+            return _ryml_to_py(tree, tree.root_id())
+    # read_bytes() hands libyaml a raw buffer — no str decode on the hot start path
+    return yaml.load(raw, Loader=_YamlLoader)
+
+CFG = _load_config(Path(os.getenv("CCC_CONFIG_FILE", "config.yaml")))
 
 ADAPTER_PATH  = CFG["adapter"]["class"]            # dotted path
 PRIMARY_KEY   = CFG["adapter"]["primary_payload_key"]
 RUN_AS_USER   = CFG["adapter"].get("run_as_user")  # may be null
 
+_MISSING_KEY_DETAIL = f"missing key '{PRIMARY_KEY}'"   # formatted once, not per 400
+
 # ---------- Dynamic import ------------------------------------------------- #
+def _cached_import(modname: str, clsname: str) -> type:
+    # sys.modules hit first — skips the full finder machinery when the adapter
+    # module is already loaded (e.g. core reloads in tests)
+    mod: ModuleType = sys.modules.get(modname) or importlib.import_module(modname)
+    return getattr(mod, clsname)
+
 modname, clsname = ADAPTER_PATH.rsplit(".", 1)
 try:
-    mod: ModuleType = importlib.import_module(modname)
-    AdapterCls      = getattr(mod, clsname)
+    AdapterCls = _cached_import(modname, clsname)
 except Exception as exc:  # noqa: BLE001
     log.critical("Cannot import adapter %s: %s", ADAPTER_PATH, exc)
     sys.exit(1)
 
 adapter = AdapterCls(CFG.get("adapter", {}))       # pyright: ignore[reportGeneralTypeIssues]
 
+# adapter is fixed for the process lifetime — resolve observability hooks once
+# instead of per-request hasattr/attribute lookups.
+_prom_fn    = getattr(adapter, "prometheus_metrics", None)
+_metrics_fn = getattr(adapter, "get_metrics", None)
+
+# Adapters that never override update() get the 409 up front — no point paying
+# for a raise/catch of NotImplementedError on every /api/update.
+_supports_update = type(adapter).update is not ApplicationAdapter.update
+_update_fn = adapter.update if _supports_update else None
+
 # ---------- Runtime state -------------------------------------------------- #
-state: Dict[str, str] = {"app_status": "initializing", "container_status": "running"}
+class _State:
+    # slot attribute access beats dict hashing on the per-request status reads
+    __slots__ = ("app_status", "container_status")
+    def __init__(self, app_status: str, container_status: str) -> None:
+        self.app_status = app_status
+        self.container_status = container_status
+
+state = _State("initializing", "running")
 current_handle: Optional[Any] = None
 
 # ---------- Helpers -------------------------------------------------------- #
-def _now() -> str: return datetime.now(tz=UTC).isoformat().replace("+00:00", "Z")
+_now_cache: tuple[int, str] = (0, "")              # (epoch second, strftime'd prefix)
 
-def _ensure_user(cmd: list[str]) -> list[str]:
-    if RUN_AS_USER and os.geteuid() == 0:
-        return ["sudo", "-E", "-u", RUN_AS_USER, "--"] + cmd
-    return cmd
+def _now() -> str:
+    # ISO-8601 UTC without datetime allocation; re-strftime only when the
+    # second ticks over, so steady-state cost is one divmod + one %-format.
+    # The cache is published as one tuple: threadpool callers racing here can
+    # at worst redo strftime, never pair a fresh second with a stale prefix.
+    global _now_cache
+    s, us = divmod(time.time_ns() // 1_000, 1_000_000)
+    cached_s, prefix = _now_cache
+    if s != cached_s:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(s))
+        _now_cache = (s, prefix)
+    return "%s.%06dZ" % (prefix, us)
 
-def _thread(fn, *args):  # fire‑and‑forget helper
-    t = threading.Thread(target=fn, args=args, daemon=True); t.start(); return t
+# RUN_AS_USER and euid are fixed for the process; decide the sudo prefix once
+# rather than re-checking geteuid() (a syscall) on every wrapped command.
+_SUDO_PREFIX = ("sudo", "-E", "-u", RUN_AS_USER, "--") if RUN_AS_USER and os.geteuid() == 0 else ()
+
+if _SUDO_PREFIX:
+    def _ensure_user(cmd: list[str]) -> list[str]: return list(_SUDO_PREFIX) + cmd
+else:
+    def _ensure_user(cmd: list[str]) -> list[str]: return cmd
+
+# Single persistent worker: no per-request thread churn, and queueing start/stop
+# on one thread serialises lifecycle ops that could previously race.
+_lifecycle_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ccc-life")
+
+# ---------- System metrics sampling ---------------------------------------- #
+# /proc reads aren't free; coalesce scrapes behind a short TTL so concurrent
+# or high-rate collectors share one sample. cpu/mem come straight from
+# /proc/stat and /proc/meminfo on persistent FDs — psutil's wrappers cost far
+# more than the two syscalls per refresh this needs.
+_METRICS_TTL = float(os.getenv("CCC_METRICS_TTL", "1.0"))
+_INV_MB = 1.0 / 1_048_576                          # multiply beats divide per field
+_metrics_cache: Dict[str, Any] = {"t": 0.0, "cpu": 0.0, "mem": None, "net": None}
+_metrics_lock = threading.Lock()
+
+_stat_fd = os.open("/proc/stat", os.O_RDONLY)
+_mem_fd  = os.open("/proc/meminfo", os.O_RDONLY)
+_last_cpu = [0, 0]                                 # (busy, total) jiffies
+
+class _MemSample(NamedTuple):
+    percent: float
+    available: int                                 # bytes
+    used: int                                      # bytes
+
+def _cpu_sample() -> float:
+    os.lseek(_stat_fd, 0, os.SEEK_SET)
+    user, nice, system, idle, iowait, irq, softirq = \
+        map(int, os.read(_stat_fd, 512).split(b"\n", 1)[0].split()[1:8])
+    busy  = user + nice + system + irq + softirq
+    total = busy + idle + iowait
+    d_busy, d_total = busy - _last_cpu[0], total - _last_cpu[1]
+    _last_cpu[0], _last_cpu[1] = busy, total
+    return 100.0 * d_busy / d_total if d_total > 0 else 0.0
+
+def _mem_sample() -> _MemSample:
+    os.lseek(_mem_fd, 0, os.SEEK_SET)
+    kb: Dict[bytes, int] = {}
+    for line in os.read(_mem_fd, 2048).splitlines():
+        key = line.split(b":", 1)[0]
+        if key in (b"MemTotal", b"MemAvailable", b"MemFree"):
+            kb[key] = int(line.split()[1])
+            if len(kb) == 3: break
+    total = kb[b"MemTotal"]
+    avail = kb.get(b"MemAvailable", kb[b"MemFree"])
+    used  = total - avail
+    return _MemSample(100.0 * used / total, avail * 1024, used * 1024)
+
+def _sample_system() -> tuple[float, _MemSample, Any]:
+    with _metrics_lock:
+        now = time.monotonic()
+        if _metrics_cache["mem"] is None or now - _metrics_cache["t"] >= _METRICS_TTL:
+            _metrics_cache["cpu"] = _cpu_sample()
+            _metrics_cache["mem"] = _mem_sample()
+            _metrics_cache["net"] = _net_io_counters()
+            _metrics_cache["t"] = now
+        return _metrics_cache["cpu"], _metrics_cache["mem"], _metrics_cache["net"]
 
 # ---------- FastAPI App ---------------------------------------------------- #
-app = FastAPI(title="Container Control Core", version="1.1")
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    # sync endpoints (metrics) run on anyio's threadpool; default 40 tokens is
+    # shared with everything else, so make the cap explicit and tunable
+    from anyio import to_thread
+    to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("CCC_THREADPOOL", "40"))
+    yield
+    # uvicorn owns SIGTERM/SIGINT and drains in-flight requests before this runs
+    if state.app_status == "running":
+        await asyncio.get_running_loop().run_in_executor(_lifecycle_pool, _stop)
 
-class StartBody(BaseModel): __root__: Dict[str, Any]       # permissive
-class UpdateBody(BaseModel): __root__: Dict[str, Any]
-class StopBody(BaseModel): force: Optional[bool] = False
+app = FastAPI(title="Container Control Core", version="1.1",
+              default_response_class=ORJSONResponse, lifespan=_lifespan)
 
 # ---------- Lifecycle glue ------------------------------------------------- #
 def _start(payload: dict):
@@ -68,39 +208,41 @@ def _start(payload: dict):
     try:
         adapter.pre_start_hooks(payload)
         current_handle = adapter.start(payload, ensure_user=_ensure_user)  # type: ignore[arg-type]
-        state["app_status"] = "running"
+        state.app_status = "running"
     except Exception:
         log.exception("Start failed")
-        state["app_status"] = "error"
+        state.app_status = "error"
 
 def _stop():
     global current_handle
     try:
         adapter.stop(); adapter.post_stop_hooks()
-        state["app_status"] = "stopped"; current_handle = None
+        state.app_status = "stopped"; current_handle = None
     except Exception:
-        log.exception("Stop failed"); state["app_status"] = "error"
+        log.exception("Stop failed"); state.app_status = "error"
 
 # ---------- API endpoints -------------------------------------------------- #
 @app.get("/api/health")
-async def health(): return {"status": "healthy", "app_status": state["app_status"]}
+async def health(): return {"status": "healthy", "app_status": state.app_status}
 
 @app.post("/api/start")
 async def api_start(body: dict):
     if PRIMARY_KEY not in body:
-        raise HTTPException(400, f"missing key '{PRIMARY_KEY}'")
-    if state["app_status"] == "running": _stop()
-    state["app_status"] = "initializing"
-    _thread(_start, body)
+        raise HTTPException(400, _MISSING_KEY_DETAIL)
+    if state.app_status == "running": _stop()
+    state.app_status = "initializing"
+    _lifecycle_pool.submit(_start, body)
     return {"message": "start initiated"}
 
 @app.post("/api/update")
 async def api_update(body: dict):
-    if state["app_status"] != "running":
+    if _update_fn is None:
+        raise HTTPException(409, "live‑update not supported")
+    if state.app_status != "running":
         raise HTTPException(400, "application not running")
     try:
-        updated = adapter.update(body)  # returns bool
-    except NotImplementedError:
+        updated = _update_fn(body)  # returns bool
+    except NotImplementedError:  # overriding adapter may still decline this way
         raise HTTPException(409, "live‑update not supported") from None
     except Exception as exc:
         log.exception("adapter.update failed")
@@ -110,49 +252,58 @@ async def api_update(body: dict):
     raise HTTPException(409, "adapter declined update")
 
 @app.post("/api/stop")
-async def api_stop(_: StopBody):
-    if state["app_status"] != "running":
+async def api_stop():
+    if state.app_status != "running":
         return {"message": "nothing to stop"}
-    _thread(_stop); return {"message": "stop initiated"}
+    _lifecycle_pool.submit(_stop); return {"message": "stop initiated"}
 
 @app.get("/api/metrics")
-async def api_metrics():
-    cpu = psutil.cpu_percent()
-    mem = psutil.virtual_memory()
-    net = psutil.net_io_counters()
-    return JSONResponse({
+def api_metrics():  # sync on purpose: blocking /proc + psutil reads go to the threadpool
+    cpu, mem, net = _sample_system()
+    return ORJSONResponse({
         "timestamp": _now(),
-        "app_status": state["app_status"],
-        "container_status": state["container_status"],
+        "app_status": state.app_status,
+        "container_status": state.container_status,
         "network": dict(bytes_sent=net.bytes_sent, bytes_recv=net.bytes_recv,
                         packets_sent=net.packets_sent, packets_recv=net.packets_recv),
-        "system": dict(cpu_percent=round(cpu,1), memory_percent=round(mem.percent,1),
-                       memory_available_mb=round(mem.available/1_048_576,2),
-                       memory_used_mb=round(mem.used/1_048_576,2)),
-        "metrics": adapter.get_metrics() or {},
+        "system": dict(cpu_percent=cpu, memory_percent=mem.percent,
+                       memory_available_mb=mem.available * _INV_MB,
+                       memory_used_mb=mem.used * _INV_MB),
+        "metrics": (_metrics_fn() or {}) if _metrics_fn and state.app_status == "running" else {},
     })
 
+# Static HELP/TYPE text baked into bytes templates at import; per scrape only
+# the value is %-formatted (C-accelerated on bytes) — no str building/encoding.
+_PROM_CPU       = (b"# HELP container_cpu_percent CPU usage %%\n"
+                   b"# TYPE container_cpu_percent gauge\n"
+                   b"container_cpu_percent %.1f\n")
+_PROM_MEM_PCT   = (b"# HELP container_memory_percent Mem usage %%\n"
+                   b"# TYPE container_memory_percent gauge\n"
+                   b"container_memory_percent %.1f\n")
+_PROM_MEM_USED  = (b"# HELP container_memory_used_bytes Used bytes\n"
+                   b"# TYPE container_memory_used_bytes gauge\n"
+                   b"container_memory_used_bytes %d\n")
+_PROM_NET_SENT  = (b"# HELP container_network_bytes_sent_total Bytes sent\n"
+                   b"# TYPE container_network_bytes_sent_total counter\n"
+                   b"container_network_bytes_sent_total %d\n")
+_PROM_NET_RECV  = (b"# HELP container_network_bytes_recv_total Bytes recv\n"
+                   b"# TYPE container_network_bytes_recv_total counter\n"
+                   b"container_network_bytes_recv_total %d\n")
+
 @app.get("/metrics")
-async def prom():
-    mem, cpu, net = psutil.virtual_memory(), psutil.cpu_percent(), psutil.net_io_counters()
-    out = [
-        "# HELP container_cpu_percent CPU usage %", f"container_cpu_percent {cpu}",
-        "# HELP container_memory_percent Mem usage %", f"container_memory_percent {mem.percent}",
-        "# HELP container_memory_used_bytes Used bytes", f"container_memory_used_bytes {mem.used}",
-        "# HELP container_network_bytes_sent_total Bytes sent", f"container_network_bytes_sent_total {net.bytes_sent}",
-        "# HELP container_network_bytes_recv_total Bytes recv", f"container_network_bytes_recv_total {net.bytes_recv}",
-    ]
-    if hasattr(adapter, "prometheus_metrics"):
-        out.extend(adapter.prometheus_metrics())
-    return Response("\n".join(out)+"\n", media_type="text/plain; version=0.0.4")
-
-# ---------- Graceful shutdown --------------------------------------------- #
-def _sig(_s, _f):
-    log.info("signal received, shutting down")
-    if state["app_status"] == "running": _stop()
-    sys.exit(0)
-
-signal.signal(signal.SIGTERM, _sig); signal.signal(signal.SIGINT, _sig)
+def prom():  # sync on purpose, same as api_metrics
+    cpu, mem, net = _sample_system()
+    buf = io.BytesIO()                             # single growable buffer, no list + join copy
+    buf.write(_PROM_CPU % cpu)
+    buf.write(_PROM_MEM_PCT % mem.percent)
+    buf.write(_PROM_MEM_USED % mem.used)
+    buf.write(_PROM_NET_SENT % net.bytes_sent)
+    buf.write(_PROM_NET_RECV % net.bytes_recv)
+    if _prom_fn:
+        for line in _prom_fn():
+            buf.write(line.encode()); buf.write(b"\n")
+    return Response(buf.getvalue(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
-    uvicorn.run("container_control_core:app", host="0.0.0.0", port=8080, loop="uvloop")
+    uvicorn.run("container_control_core:app", host="0.0.0.0", port=8080,
+                loop="uvloop", http="httptools")
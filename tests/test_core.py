@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import importlib.util
 import os
 import time
 from pathlib import Path
@@ -10,6 +11,36 @@ from tests.dummy_adapter import DummyAdapter, NoUpdateAdapter, ErrorUpdateAdapte
 from tests.conftest import load_core
 
 
+class FakeRymlTree:
+    """Minimal stand-in for a parsed ryml tree.
+
+    Built from nested dict / list / bytes (scalar) / None (missing value)
+    structures; exposes just the node API _ryml_to_py walks.
+    """
+
+    def __init__(self, root) -> None:
+        self._nodes: list[dict] = []
+        self._root = self._add(None, root)
+
+    def _add(self, key: bytes | None, value) -> int:
+        idx = len(self._nodes)
+        self._nodes.append({"key": key, "value": value, "children": []})
+        if isinstance(value, dict):
+            self._nodes[idx]["children"] = [self._add(k.encode(), v) for k, v in value.items()]
+        elif isinstance(value, list):
+            self._nodes[idx]["children"] = [self._add(None, v) for v in value]
+        return idx
+
+    def root_id(self) -> int: return self._root
+    def is_map(self, i: int) -> bool: return isinstance(self._nodes[i]["value"], dict)
+    def is_seq(self, i: int) -> bool: return isinstance(self._nodes[i]["value"], list)
+    def num_children(self, i: int) -> int: return len(self._nodes[i]["children"])
+    def child(self, i: int, n: int) -> int: return self._nodes[i]["children"][n]
+    def key(self, i: int) -> memoryview: return memoryview(self._nodes[i]["key"])
+    def has_val(self, i: int) -> bool: return self._nodes[i]["value"] is not None
+    def val(self, i: int) -> memoryview: return memoryview(self._nodes[i]["value"])
+
+
 def make_config(tmp_path: Path, adapter_cls: str, run_as_user: str | None = None) -> Path:
     cfg = {
         "adapter": {
@@ -31,12 +62,12 @@ def test_start_stop_cycle(tmp_path):
     resp = client.post("/api/start", json={"payload": 1})
     assert resp.status_code == 200
     time.sleep(0.05)
-    assert core.state["app_status"] == "running"
+    assert core.state.app_status == "running"
 
     resp = client.post("/api/stop", json={})
     assert resp.status_code == 200
     time.sleep(0.05)
-    assert core.state["app_status"] == "stopped"
+    assert core.state.app_status == "stopped"
     assert isinstance(core.adapter, DummyAdapter)
     assert core.adapter.stopped
 
@@ -159,3 +190,40 @@ def test_ensure_user_non_root(tmp_path, monkeypatch):
     client.post("/api/start", json={"payload": 1})
     time.sleep(0.05)
     assert core.adapter.ensure_user_cmd == ["dummy"]
+
+
+def test_ryml_converter(tmp_path):
+    cfg_path = make_config(tmp_path, "tests.dummy_adapter.DummyAdapter")
+    _, core = load_core({"config_path": str(cfg_path)})
+
+    tree = FakeRymlTree({
+        "adapter": {
+            "class": b"tests.dummy_adapter.DummyAdapter",
+            "run_as_user": b"null",
+            "tilde": b"~",
+            "empty": b"",
+            "missing": None,
+            "args": [b"one", b"two"],
+        }
+    })
+    assert core._ryml_to_py(tree, tree.root_id()) == {
+        "adapter": {
+            "class": "tests.dummy_adapter.DummyAdapter",
+            "run_as_user": None,
+            "tilde": None,
+            "empty": None,
+            "missing": None,
+            "args": ["one", "two"],
+        }
+    }
+
+
+def test_yaml_backend_fallback_without_ryml(tmp_path, monkeypatch):
+    if importlib.util.find_spec("ryml") is not None:
+        pytest.skip("ryml installed; PyYAML fallback not exercised")
+    monkeypatch.setenv("CCC_YAML_BACKEND", "ryml")
+    cfg_path = make_config(tmp_path, "tests.dummy_adapter.DummyAdapter")
+    _, core = load_core({"config_path": str(cfg_path)})
+
+    assert core.PRIMARY_KEY == "payload"
+    assert core.RUN_AS_USER is None